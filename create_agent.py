@@ -9,9 +9,111 @@ Creates the Bedrock supervisor agent with two action groups:
 
 import boto3
 import json
+import time
 
 bedrock_agent = boto3.client("bedrock-agent", region_name="us-east-1")
 
+# Agent status polling backoff: first check after 50 ms, doubling up to 2 s
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 2.0
+
+PIPELINE_FUNCTION_SCHEMA = {
+    "functions": [
+        {
+            "name": "trigger_glue_job",
+            "description": "Trigger or re-run a Glue ETL job by name",
+            "parameters": {
+                "job_name": {"type": "string", "required": True},
+                "arguments": {"type": "object", "required": False},
+            },
+        },
+        {
+            "name": "get_job_status",
+            "description": "Get status, duration, and error logs for a Glue job run",
+            "parameters": {
+                "job_name": {"type": "string", "required": True},
+                "run_id": {"type": "string", "required": False},
+            },
+        },
+        {
+            "name": "quarantine_records",
+            "description": "Move bad records to quarantine S3 prefix for human review",
+            "parameters": {
+                "source_path": {"type": "string", "required": True},
+                "reason": {"type": "string", "required": True},
+            },
+        },
+        {
+            "name": "patch_schema_mapping",
+            "description": "Update a Glue job's schema mapping when column names change",
+            "parameters": {
+                "job_name": {"type": "string", "required": True},
+                "old_column": {"type": "string", "required": True},
+                "new_column": {"type": "string", "required": True},
+            },
+        },
+    ]
+}
+
+DQ_FUNCTION_SCHEMA = {
+    "functions": [
+        {
+            "name": "run_dq_check",
+            "description": "Run Glue Data Quality rules on a dataset and return scores",
+            "parameters": {
+                "database": {"type": "string", "required": True},
+                "table": {"type": "string", "required": True},
+            },
+        },
+        {
+            "name": "execute_nl_query",
+            "description": "Convert a natural language question to Athena SQL and execute it",
+            "parameters": {
+                "question": {"type": "string", "required": True},
+                "database": {"type": "string", "required": False},
+                "schema_version": {
+                    "type": "string",
+                    "required": False,
+                    "description": (
+                        "Catalog schema version for this database. Omit (or '0') until "
+                        "you patch a schema mapping; after each successful "
+                        "patch_schema_mapping, pass a new value (increment: '1', '2', ...) "
+                        "so cached schema and query results from before the patch are skipped"
+                    ),
+                },
+                "table_filter": {
+                    "type": "string",
+                    "required": False,
+                    "description": (
+                        "Glue table-name Expression (regular expression) limiting the "
+                        "schema context to the tables the question needs, e.g. "
+                        "'sales.*' or 'orders|customers'. Omit to use the first tables "
+                        "in the database"
+                    ),
+                },
+            },
+        },
+    ]
+}
+
+
+def wait_for_agent_status(agent_id: str, target: str, timeout_seconds: int = 300):
+    """Block until the agent reaches `target` status, so the next call doesn't race it."""
+    deadline = time.monotonic() + timeout_seconds
+    delay = POLL_INITIAL_DELAY
+    while True:
+        status = bedrock_agent.get_agent(agentId=agent_id)["agent"]["agentStatus"]
+        if status == target:
+            return
+        if status == "FAILED":
+            raise RuntimeError(f"Agent {agent_id} entered FAILED while waiting for {target}")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Agent {agent_id} still {status} after {timeout_seconds}s")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
 
 def create_de_agent():
     response = bedrock_agent.create_agent(
@@ -27,6 +129,11 @@ def create_de_agent():
         4. Answer natural language queries about pipeline data via Athena
         5. Log all decisions with reasoning and confidence scores
 
+        After patch_schema_mapping succeeds, increment the schema_version you pass
+        to execute_nl_query (start from 0) so queries see the patched schema.
+        When you know which tables a question touches, pass them as table_filter
+        (a Glue table-name regular expression, e.g. "sales.*") for a tighter schema.
+
         Always explain your reasoning before taking any action.
         Never make irreversible changes without logging intent first.
         """,
@@ -40,6 +147,7 @@ def create_de_agent():
 
 
 def add_pipeline_action_group(agent_id: str):
+    wait_for_agent_status(agent_id, "NOT_PREPARED")
     bedrock_agent.create_agent_action_group(
         agentId=agent_id,
         agentVersion="DRAFT",
@@ -47,48 +155,13 @@ def add_pipeline_action_group(agent_id: str):
         actionGroupExecutor={
             "lambda": "arn:aws:lambda:us-east-1:YOUR_ACCOUNT_ID:function:pipeline-manager"
         },
-        functionSchema={
-            "functions": [
-                {
-                    "name": "trigger_glue_job",
-                    "description": "Trigger or re-run a Glue ETL job by name",
-                    "parameters": {
-                        "job_name": {"type": "string", "required": True},
-                        "arguments": {"type": "object", "required": False},
-                    },
-                },
-                {
-                    "name": "get_job_status",
-                    "description": "Get status, duration, and error logs for a Glue job run",
-                    "parameters": {
-                        "job_name": {"type": "string", "required": True},
-                        "run_id": {"type": "string", "required": False},
-                    },
-                },
-                {
-                    "name": "quarantine_records",
-                    "description": "Move bad records to quarantine S3 prefix for human review",
-                    "parameters": {
-                        "source_path": {"type": "string", "required": True},
-                        "reason": {"type": "string", "required": True},
-                    },
-                },
-                {
-                    "name": "patch_schema_mapping",
-                    "description": "Update a Glue job's schema mapping when column names change",
-                    "parameters": {
-                        "job_name": {"type": "string", "required": True},
-                        "old_column": {"type": "string", "required": True},
-                        "new_column": {"type": "string", "required": True},
-                    },
-                },
-            ]
-        },
+        functionSchema=PIPELINE_FUNCTION_SCHEMA,
     )
     print("✅ PipelineManagement action group added")
 
 
 def add_dq_action_group(agent_id: str):
+    wait_for_agent_status(agent_id, "NOT_PREPARED")
     bedrock_agent.create_agent_action_group(
         agentId=agent_id,
         agentVersion="DRAFT",
@@ -96,32 +169,15 @@ def add_dq_action_group(agent_id: str):
         actionGroupExecutor={
             "lambda": "arn:aws:lambda:us-east-1:YOUR_ACCOUNT_ID:function:dq-remediator"
         },
-        functionSchema={
-            "functions": [
-                {
-                    "name": "run_dq_check",
-                    "description": "Run Glue Data Quality rules on a dataset and return scores",
-                    "parameters": {
-                        "database": {"type": "string", "required": True},
-                        "table": {"type": "string", "required": True},
-                    },
-                },
-                {
-                    "name": "execute_nl_query",
-                    "description": "Convert a natural language question to Athena SQL and execute it",
-                    "parameters": {
-                        "question": {"type": "string", "required": True},
-                        "database": {"type": "string", "required": False},
-                    },
-                },
-            ]
-        },
+        functionSchema=DQ_FUNCTION_SCHEMA,
     )
     print("✅ DataQualityRemediation action group added")
 
 
 def prepare_and_deploy(agent_id: str):
+    wait_for_agent_status(agent_id, "NOT_PREPARED")
     bedrock_agent.prepare_agent(agentId=agent_id)
+    wait_for_agent_status(agent_id, "PREPARED")
 
     alias = bedrock_agent.create_agent_alias(
         agentId=agent_id,
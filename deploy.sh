@@ -23,7 +23,30 @@ echo "📤 Uploading Glue scripts..."
 aws s3 cp glue/sales_transform_job.py \
     s3://${BUCKET_PREFIX}-glue-scripts/scripts/sales_transform_job.py
 
-# ─── Step 3: Package and deploy Lambda functions ─────────────────────────────
+# ─── Step 3: Create NL-to-SQL audit queue and cache ──────────────────────────
+echo "🗄️  Creating NL-to-SQL audit queue and cache..."
+
+# Audit records from nl_to_sql/handler.py (audit()) — create-queue is idempotent
+aws sqs create-queue \
+    --queue-name agentic-de-nlq-audit \
+    --region $REGION
+
+# Repeated-question result cache; "exp" is the TTL attribute DynamoDB reaps on
+aws dynamodb create-table \
+    --table-name agent-nlq-cache \
+    --attribute-definitions AttributeName=k,AttributeType=S \
+    --key-schema AttributeName=k,KeyType=HASH \
+    --billing-mode PAY_PER_REQUEST \
+    --region $REGION \
+    2>/dev/null || true
+aws dynamodb wait table-exists --table-name agent-nlq-cache --region $REGION
+aws dynamodb update-time-to-live \
+    --table-name agent-nlq-cache \
+    --time-to-live-specification "Enabled=true,AttributeName=exp" \
+    --region $REGION \
+    2>/dev/null || true
+
+# ─── Step 4: Package and deploy Lambda functions ─────────────────────────────
 echo "⚡ Packaging Lambda functions..."
 
 for fn in pipeline_manager nl_to_sql; do
@@ -49,7 +72,7 @@ for fn in pipeline_manager nl_to_sql; do
     echo "  ✅ $fn deployed"
 done
 
-# ─── Step 4: Deploy Step Functions state machine ─────────────────────────────
+# ─── Step 5: Deploy Step Functions state machine ─────────────────────────────
 echo "🔄 Deploying Step Functions state machine..."
 
 # Replace placeholders with real values
@@ -68,11 +91,11 @@ aws stepfunctions create-state-machine \
 
 echo "  ✅ State machine deployed"
 
-# ─── Step 5: Create Bedrock Agent ────────────────────────────────────────────
+# ─── Step 6: Create Bedrock Agent ────────────────────────────────────────────
 echo "🤖 Setting up Bedrock Agent..."
 python3 agents/create_agent.py
 
-# ─── Step 6: Create EventBridge rule for self-healing ────────────────────────
+# ─── Step 7: Create EventBridge rule for self-healing ────────────────────────
 echo "📡 Creating EventBridge rule for pipeline failure detection..."
 
 aws events put-rule \
@@ -85,9 +108,90 @@ aws events put-rule \
     --state ENABLED \
     --region $REGION
 
+# Diagnosis cache shared by self-healing-agent containers; TTL on "exp"
+aws dynamodb create-table \
+    --table-name self-healing-diagnosis-cache \
+    --attribute-definitions AttributeName=k,AttributeType=S \
+    --key-schema AttributeName=k,KeyType=HASH \
+    --billing-mode PAY_PER_REQUEST \
+    --region $REGION \
+    2>/dev/null || true
+aws dynamodb wait table-exists --table-name self-healing-diagnosis-cache --region $REGION
+aws dynamodb update-time-to-live \
+    --table-name self-healing-diagnosis-cache \
+    --time-to-live-specification "Enabled=true,AttributeName=exp" \
+    --region $REGION \
+    2>/dev/null || true
+
+# EventBridge → self-healing-enqueue (queues and returns) → SQS → self-healing-agent
+# Events that fail healing 3 times land in the DLQ instead of re-paging for days
+aws sqs create-queue \
+    --queue-name self-healing-events-dlq \
+    --attributes MessageRetentionPeriod=1209600 \
+    --region $REGION
+
+# Visibility timeout covers the worker's maximum Lambda timeout
+aws sqs create-queue \
+    --queue-name self-healing-events \
+    --attributes '{
+        "VisibilityTimeout": "900",
+        "RedrivePolicy": "{\"deadLetterTargetArn\":\"arn:aws:sqs:'$REGION':'$ACCOUNT_ID':self-healing-events-dlq\",\"maxReceiveCount\":\"3\"}"
+    }' \
+    --region $REGION
+
+# Both functions ship from agents/self_healing_pipeline.py. The worker timeout
+# (840 s) stays below the queue's 900 s visibility timeout, so a message is never
+# redelivered while its healing session is still running.
+zip -q -j /tmp/self_healing.zip agents/self_healing_pipeline.py
+
+for spec in "self-healing-agent:lambda_handler:840" "self-healing-enqueue:enqueue_handler:10"; do
+    IFS=: read -r fn handler timeout <<< "$spec"
+    if aws lambda get-function --function-name $fn --region $REGION >/dev/null 2>&1; then
+        aws lambda update-function-code \
+            --function-name $fn \
+            --zip-file fileb:///tmp/self_healing.zip \
+            --region $REGION
+        aws lambda wait function-updated --function-name $fn --region $REGION
+        aws lambda update-function-configuration \
+            --function-name $fn \
+            --handler self_healing_pipeline.$handler \
+            --timeout $timeout \
+            --region $REGION
+    else
+        aws lambda create-function \
+            --function-name $fn \
+            --runtime python3.12 \
+            --role arn:aws:iam::${ACCOUNT_ID}:role/DEAgentLambdaRole \
+            --handler self_healing_pipeline.$handler \
+            --zip-file fileb:///tmp/self_healing.zip \
+            --timeout $timeout \
+            --memory-size 512 \
+            --region $REGION
+    fi
+    echo "  ✅ $fn deployed"
+done
+
+aws lambda create-event-source-mapping \
+    --function-name self-healing-agent \
+    --event-source-arn arn:aws:sqs:$REGION:$ACCOUNT_ID:self-healing-events \
+    --batch-size 1 \
+    --function-response-types ReportBatchItemFailures \
+    --region $REGION \
+    2>/dev/null || true
+
+# Let the rule invoke the enqueue function (already-granted on re-deploy)
+aws lambda add-permission \
+    --function-name self-healing-enqueue \
+    --statement-id GlueJobFailureDetector \
+    --action lambda:InvokeFunction \
+    --principal events.amazonaws.com \
+    --source-arn arn:aws:events:$REGION:$ACCOUNT_ID:rule/GlueJobFailureDetector \
+    --region $REGION \
+    2>/dev/null || true
+
 aws events put-targets \
     --rule GlueJobFailureDetector \
-    --targets "Id=SelfHealingAgent,Arn=arn:aws:lambda:$REGION:$ACCOUNT_ID:function:self-healing-agent" \
+    --targets "Id=SelfHealingEnqueue,Arn=arn:aws:lambda:$REGION:$ACCOUNT_ID:function:self-healing-enqueue" \
     --region $REGION
 
 echo ""
@@ -90,7 +90,7 @@ BEDROCK_AGENT_POLICY = {
         {
             "Sid": "InvokeFoundationModel",
             "Effect": "Allow",
-            "Action": ["bedrock:InvokeModel"],
+            "Action": ["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream"],
             "Resource": "arn:aws:bedrock:us-east-1::foundation-model/anthropic.claude-3-5-sonnet-20241022-v2:0",
         },
         {
@@ -128,6 +128,7 @@ LAMBDA_ACTION_GROUP_POLICY = {
                 "glue:GetCrawler",
                 "glue:GetTables",
                 "glue:GetTable",
+                "glue:GetDatabases",
             ],
             "Resource": "*",
         },
@@ -156,14 +157,25 @@ LAMBDA_ACTION_GROUP_POLICY = {
                 "athena:GetQueryExecution",
                 "athena:GetQueryResults",
                 "athena:StopQueryExecution",
+                "athena:ListWorkGroups",
             ],
             "Resource": "*",
         },
         {
             "Sid": "BedrockInvoke",
             "Effect": "Allow",
-            "Action": ["bedrock:InvokeModel"],
-            "Resource": "arn:aws:bedrock:us-east-1::foundation-model/anthropic.claude-3-5-sonnet-20241022-v2:0",
+            "Action": ["bedrock:InvokeModel", "bedrock:InvokeModelWithResponseStream"],
+            "Resource": [
+                "arn:aws:bedrock:us-east-1::foundation-model/anthropic.claude-3-5-sonnet-20241022-v2:0",
+                "arn:aws:bedrock:us-east-2:YOUR_ACCOUNT_ID:inference-profile/us.anthropic.claude-3-5-haiku-20241022-v1:0",
+                "arn:aws:bedrock:*::foundation-model/anthropic.claude-3-5-haiku-20241022-v1:0",
+            ],
+        },
+        {
+            "Sid": "BedrockConnectionWarmup",
+            "Effect": "Allow",
+            "Action": ["bedrock:ListAsyncInvokes"],
+            "Resource": "*",
         },
         {
             "Sid": "SSMAuditLog",
@@ -180,9 +192,44 @@ LAMBDA_ACTION_GROUP_POLICY = {
         {
             "Sid": "LogsAccess",
             "Effect": "Allow",
-            "Action": ["logs:FilterLogEvents", "logs:GetLogEvents"],
+            "Action": ["logs:FilterLogEvents", "logs:GetLogEvents", "logs:StartQuery"],
             "Resource": "arn:aws:logs:us-east-1:YOUR_ACCOUNT_ID:log-group:/aws-glue/jobs/*",
         },
+        {
+            "Sid": "LogsInsightsResults",
+            "Effect": "Allow",
+            "Action": ["logs:GetQueryResults", "logs:StopQuery"],
+            "Resource": "*",
+        },
+        {
+            "Sid": "NLQueryCache",
+            "Effect": "Allow",
+            "Action": ["dynamodb:GetItem", "dynamodb:PutItem"],
+            "Resource": "arn:aws:dynamodb:us-east-1:YOUR_ACCOUNT_ID:table/agent-nlq-cache",
+        },
+        {
+            "Sid": "SQSAuditQueue",
+            "Effect": "Allow",
+            "Action": ["sqs:SendMessage"],
+            "Resource": "arn:aws:sqs:us-east-1:YOUR_ACCOUNT_ID:agentic-de-nlq-audit",
+        },
+        {
+            "Sid": "SelfHealingDiagnosisCache",
+            "Effect": "Allow",
+            "Action": ["dynamodb:GetItem", "dynamodb:PutItem"],
+            "Resource": "arn:aws:dynamodb:us-east-1:YOUR_ACCOUNT_ID:table/self-healing-diagnosis-cache",
+        },
+        {
+            "Sid": "SQSSelfHealingQueue",
+            "Effect": "Allow",
+            "Action": [
+                "sqs:SendMessage",
+                "sqs:ReceiveMessage",
+                "sqs:DeleteMessage",
+                "sqs:GetQueueAttributes",
+            ],
+            "Resource": "arn:aws:sqs:us-east-1:YOUR_ACCOUNT_ID:self-healing-events",
+        },
         {
             "Sid": "SNSEscalation",
             "Effect": "Allow",
@@ -193,54 +240,61 @@ LAMBDA_ACTION_GROUP_POLICY = {
 }
 
 
+BEDROCK_TRUST_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Principal": {"Service": "bedrock.amazonaws.com"},
+            "Action": "sts:AssumeRole",
+        }
+    ],
+}
+
+LAMBDA_TRUST_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Principal": {"Service": "lambda.amazonaws.com"},
+            "Action": "sts:AssumeRole",
+        }
+    ],
+}
+
+# Policy documents serialised once at import, compact to stay well under IAM size limits
+_BEDROCK_AGENT_POLICY_JSON = json.dumps(BEDROCK_AGENT_POLICY, separators=(",", ":"))
+_LAMBDA_ACTION_GROUP_POLICY_JSON = json.dumps(LAMBDA_ACTION_GROUP_POLICY, separators=(",", ":"))
+_BEDROCK_TRUST_JSON = json.dumps(BEDROCK_TRUST_POLICY, separators=(",", ":"))
+_LAMBDA_TRUST_JSON = json.dumps(LAMBDA_TRUST_POLICY, separators=(",", ":"))
+
+
 def create_iam_roles():
     # Bedrock Agent Role
     iam.create_role(
         RoleName="BedrockDataEngineeringAgentRole",
-        AssumeRolePolicyDocument=json.dumps(
-            {
-                "Version": "2012-10-17",
-                "Statement": [
-                    {
-                        "Effect": "Allow",
-                        "Principal": {"Service": "bedrock.amazonaws.com"},
-                        "Action": "sts:AssumeRole",
-                    }
-                ],
-            }
-        ),
+        AssumeRolePolicyDocument=_BEDROCK_TRUST_JSON,
         Description="IAM role for the autonomous DE Bedrock Agent",
     )
 
     iam.put_role_policy(
         RoleName="BedrockDataEngineeringAgentRole",
         PolicyName="BedrockAgentPolicy",
-        PolicyDocument=json.dumps(BEDROCK_AGENT_POLICY),
+        PolicyDocument=_BEDROCK_AGENT_POLICY_JSON,
     )
     print("✅ BedrockDataEngineeringAgentRole created")
 
     # Lambda Action Group Role
     iam.create_role(
         RoleName="DEAgentLambdaRole",
-        AssumeRolePolicyDocument=json.dumps(
-            {
-                "Version": "2012-10-17",
-                "Statement": [
-                    {
-                        "Effect": "Allow",
-                        "Principal": {"Service": "lambda.amazonaws.com"},
-                        "Action": "sts:AssumeRole",
-                    }
-                ],
-            }
-        ),
+        AssumeRolePolicyDocument=_LAMBDA_TRUST_JSON,
         Description="IAM role for Lambda action group functions",
     )
 
     iam.put_role_policy(
         RoleName="DEAgentLambdaRole",
         PolicyName="DEAgentLambdaPolicy",
-        PolicyDocument=json.dumps(LAMBDA_ACTION_GROUP_POLICY),
+        PolicyDocument=_LAMBDA_ACTION_GROUP_POLICY_JSON,
     )
     print("✅ DEAgentLambdaRole created")
 
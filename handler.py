@@ -7,23 +7,87 @@ executes them, and returns structured results to the Bedrock agent.
 """
 
 import boto3
+import hashlib
 import json
+import re
 import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+from botocore.config import Config
 
-athena = boto3.client("athena")
-glue = boto3.client("glue")
-bedrock = boto3.client("bedrock-runtime", region_name="us-east-1")
+logger = logging.getLogger()
+# Query/SQL audit trail goes to SQS (see audit()); keep CloudWatch for warnings
+logger.setLevel(logging.WARNING)
+
+# Tight timeouts + adaptive retries bound tail latency under throttling;
+# keepalive stops NAT idle resets between warm invocations.
+_cfg = Config(
+    retries={"max_attempts": 3, "mode": "adaptive"},
+    connect_timeout=2,
+    read_timeout=20,
+    tcp_keepalive=True,
+    max_pool_connections=20,
+)
+
+athena = boto3.client("athena", config=_cfg)
+glue = boto3.client("glue", config=_cfg)
+sqs = boto3.client("sqs", config=_cfg)
+ddb = boto3.client("dynamodb", config=_cfg)
+# Latency-optimized inference for Claude 3.5 Haiku is only served from us-east-2
+bedrock = boto3.client("bedrock-runtime", region_name="us-east-2", config=_cfg)
 
 ATHENA_OUTPUT = "s3://my-athena-results/agent-queries/"
+AUDIT_QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/YOUR_ACCOUNT_ID/agentic-de-nlq-audit"
 DEFAULT_DATABASE = "data_warehouse"
-MODEL_ID = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+MODEL_ID = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
 
 # Statements that must never be executed via this action group
 BLOCKED_KEYWORDS = ["DROP", "DELETE", "INSERT", "UPDATE", "ALTER", "TRUNCATE", "CREATE"]
+_MAX_KEYWORD_LEN = max(len(kw) for kw in BLOCKED_KEYWORDS)
+# Single-pass, word-bounded scan — column names like UPDATED_AT don't trip it
+_BLOCKED_RE = re.compile(
+    r"\b(?:" + "|".join(BLOCKED_KEYWORDS) + r")\b", re.IGNORECASE
+)
+
+SQL_RULES = """Generate a single valid Athena SQL (Presto dialect) query to answer the question below.
+
+Rules:
+- Return ONLY the raw SQL query, no explanation, no markdown backticks
+- Use Athena/Presto syntax
+- Add LIMIT 1000 unless the question is an aggregation
+- Handle NULL values with COALESCE where appropriate
+- Use date_trunc or date_format for date grouping questions
+"""
+
+# Rows returned to the agent — matches the LIMIT the SQL prompt asks for
+RESULT_MAX_ROWS = 1000
+# Bedrock Agents reject action-group responses over ~25 KB; rows beyond this
+# budget (measured as the escaped body string in the Lambda response) are
+# dropped and the result is flagged truncated
+RESPONSE_BODY_MAX_BYTES = 24 * 1024
+
+# Athena polling backoff: first check after 50 ms, doubling up to 2 s
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 2.0
+
+# Catalog schema cache — survives across warm invocations of the same container.
+# Keyed by (database, schema_version, table_filter); callers bump schema_version
+# after a patch_schema_mapping so the next query re-reads the catalog.
+_SCHEMA_TTL = 300
+_SCHEMA_CACHE: dict[tuple[str, str, str], tuple[float, str]] = {}
+SCHEMA_MAX_TABLES = 10  # Limit prompt context size
+
+# Result cache for repeated questions — shared across containers via DynamoDB.
+# "exp" is also the table's TTL attribute, so expired items are reaped server-side.
+NLQ_CACHE_TABLE = "agent-nlq-cache"
+NLQ_CACHE_TTL = 900
+NLQ_CACHE_MAX_BYTES = 350 * 1024  # stay under the 400 KB DynamoDB item limit
+
+# Background I/O overlapped with the request path (reused across warm invocations)
+_executor = ThreadPoolExecutor(max_workers=2)
+_bedrock_warm = False
 
 
 def lambda_handler(event, context):
@@ -35,6 +99,10 @@ def lambda_handler(event, context):
         result = execute_nl_query(
             question=params["question"],
             database=params.get("database", DEFAULT_DATABASE),
+            # Bumped by the agent after patch_schema_mapping (see DQ_FUNCTION_SCHEMA);
+            # part of both the schema and result cache keys
+            schema_version=params.get("schema_version", "0"),
+            table_filter=params.get("table_filter", ""),
         )
     else:
         result = {"error": f"Unknown function: {function_name}"}
@@ -51,20 +119,37 @@ def lambda_handler(event, context):
     }
 
 
-def execute_nl_query(question: str, database: str = DEFAULT_DATABASE) -> dict:
+def execute_nl_query(
+    question: str,
+    database: str = DEFAULT_DATABASE,
+    schema_version: str = "0",
+    table_filter: str = "",
+) -> dict:
     """
     Full pipeline: NL question → SQL generation → safety check → Athena execution → results
     """
-    logger.info(f"NL query received: {question}")
+    audit("nl_query_received", question=question, database=database)
+
+    cache_key = nl_query_cache_key(question, database, schema_version, table_filter)
+    cached = get_cached_result(cache_key)
+    if cached is not None:
+        return cached
+
+    # Open the Bedrock connection while the Glue catalog lookup is in flight
+    if not _bedrock_warm:
+        _executor.submit(warm_bedrock_connection)
 
     # 1. Get schema context from Glue Data Catalog
-    schema_context = get_catalog_schema(database)
+    schema_context = get_catalog_schema(database, schema_version, table_filter)
 
     # 2. Generate SQL with Claude
-    sql_query = generate_sql(question, database, schema_context)
-    logger.info(f"Generated SQL: {sql_query}")
+    sql_query, rejected = generate_sql(question, database, schema_context)
+    audit("sql_generated", question=question, database=database, sql=sql_query)
 
-    # 3. Safety validation
+    # 3. Safety validation — incomplete SQL (cancelled stream or max_tokens cut-off)
+    # is rejected outright, not re-validated
+    if rejected:
+        return {"error": f"Query blocked: {rejected}", "sql": sql_query}
     safety_check = validate_sql(sql_query)
     if not safety_check["safe"]:
         return {"error": f"Query blocked: {safety_check['reason']}", "sql": sql_query}
@@ -77,64 +162,247 @@ def execute_nl_query(question: str, database: str = DEFAULT_DATABASE) -> dict:
     if state != "SUCCEEDED":
         return {"error": f"Athena query {state}", "sql": sql_query, "query_id": query_id}
 
-    # 6. Fetch and return results
-    return fetch_results(query_id, sql_query, stats)
+    # 6. Fetch, cache and return results
+    result = fetch_results(query_id, sql_query, stats)
+    # Inline, not on the executor: Lambda freezes the container on return, which
+    # would delay or drop the write before another container can hit it
+    put_cached_result(cache_key, result)
+    return result
+
+
+def nl_query_cache_key(question, database, schema_version, table_filter) -> str:
+    raw = f"{database}|{schema_version}|{table_filter}|{question.strip().lower()}"
+    return hashlib.sha256(raw.encode()).hexdigest()
 
 
-def get_catalog_schema(database: str) -> str:
-    """Pull table schemas from Glue Data Catalog for SQL context."""
+def get_cached_result(key: str):
+    """Return a cached, unexpired result payload, or None on miss/error."""
+    try:
+        hit = ddb.get_item(
+            TableName=NLQ_CACHE_TABLE, Key={"k": {"S": key}}, ConsistentRead=False
+        )
+        item = hit.get("Item")
+        if item and int(item["exp"]["N"]) > time.time():
+            return json.loads(item["v"]["S"])
+    except Exception as e:
+        logger.warning(f"NL query cache read failed: {e}")
+    return None
+
+
+def put_cached_result(key: str, result: dict):
+    """Store a successful result unless it's too large for a DynamoDB item."""
+    payload = json.dumps(result)
+    if len(payload) > NLQ_CACHE_MAX_BYTES:
+        return
+    try:
+        ddb.put_item(
+            TableName=NLQ_CACHE_TABLE,
+            Item={
+                "k": {"S": key},
+                "v": {"S": payload},
+                "exp": {"N": str(int(time.time()) + NLQ_CACHE_TTL)},
+            },
+        )
+    except Exception as e:
+        logger.warning(f"NL query cache write failed: {e}")
+
+
+def audit(event_type: str, **fields):
+    """Queue an audit record to SQS on the background executor (fire-and-forget)."""
+    record = {"event": event_type, "timestamp": time.time(), **fields}
+    _executor.submit(send_audit_record, record)
+
+
+def send_audit_record(record: dict):
+    try:
+        sqs.send_message(QueueUrl=AUDIT_QUEUE_URL, MessageBody=json.dumps(record))
+    except Exception as e:
+        logger.warning(f"Could not send audit record: {e}")
+
+
+def warm_bedrock_connection():
+    """Cheap bedrock-runtime call that leaves a pooled TLS connection open."""
+    global _bedrock_warm
+    try:
+        bedrock.list_async_invokes(maxResults=1)
+        _bedrock_warm = True
+    except Exception as e:
+        logger.warning(f"Bedrock warm-up failed: {e}")
+
+
+def warm_connection(service: str, call):
+    """Issue a cheap call so the client's connection pool is hot; errors are non-fatal."""
+    try:
+        call()
+    except Exception as e:
+        logger.warning(f"{service} warm-up failed: {e}")
+
+
+def warm_connections_on_init():
+    """Open Bedrock, Athena and Glue connections in parallel during Lambda INIT."""
+    warmups = [
+        warm_bedrock_connection,
+        lambda: warm_connection("Athena", lambda: athena.list_work_groups(MaxResults=1)),
+        lambda: warm_connection("Glue", lambda: glue.get_databases(MaxResults=1)),
+    ]
+    for warm in warmups:
+        threading.Thread(target=warm, daemon=True).start()
+
+
+def get_catalog_schema(
+    database: str, schema_version: str = "0", table_filter: str = ""
+) -> str:
+    """Pull table schemas from Glue Data Catalog for SQL context (TTL-cached).
+
+    Only the first SCHEMA_MAX_TABLES tables are requested; table_filter is an
+    optional Glue table-name Expression — a regular expression such as
+    "sales.*" or "orders|customers" — supplied by the agent.
+    """
+    key = (database, schema_version, table_filter)
+    cached = _SCHEMA_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < _SCHEMA_TTL:
+        return cached[1]
+
+    request = {
+        "DatabaseName": database,
+        "PaginationConfig": {
+            "MaxItems": SCHEMA_MAX_TABLES,
+            "PageSize": SCHEMA_MAX_TABLES,
+        },
+    }
+    if table_filter:
+        request["Expression"] = table_filter
+
     try:
-        tables = glue.get_tables(DatabaseName=database)["TableList"]
         schema_lines = []
-        for table in tables[:10]:  # Limit context size
-            cols = ", ".join(
-                f"{c['Name']} ({c['Type']['Name']})"
-                for c in table.get("StorageDescriptor", {}).get("Columns", [])
-            )
-            schema_lines.append(f"  TABLE {table['Name']}: {cols}")
-        return "\n".join(schema_lines) or "No tables found in catalog"
+        paginator = glue.get_paginator("get_tables")
+        for page in paginator.paginate(**request):
+            for table in page["TableList"]:
+                cols = ", ".join(
+                    f"{c['Name']} ({c['Type']['Name']})"
+                    for c in table.get("StorageDescriptor", {}).get("Columns", [])
+                )
+                schema_lines.append(f"  TABLE {table['Name']}: {cols}")
+        schema = "\n".join(schema_lines) or "No tables found in catalog"
     except Exception as e:
         logger.warning(f"Could not fetch schema: {e}")
         return "Schema unavailable — generate best-effort SQL"
 
+    _SCHEMA_CACHE[key] = (time.monotonic(), schema)
+    return schema
 
-def generate_sql(question: str, database: str, schema_context: str) -> str:
-    """Use Claude to convert NL question into Athena-compatible SQL."""
-    prompt = f"""Generate a single valid Athena SQL (Presto dialect) query to answer this question.
-
-Database: {database}
-Schema:
-{schema_context}
 
-Question: {question}
+def generate_sql(question: str, database: str, schema_context: str):
+    """Use Claude to convert NL question into Athena-compatible SQL.
 
-Rules:
-- Return ONLY the raw SQL query, no explanation, no markdown backticks
-- Use Athena/Presto syntax
-- Add LIMIT 1000 unless the question is an aggregation
-- Handle NULL values with COALESCE where appropriate
-- Use date_trunc or date_format for date grouping questions
-"""
+    Returns (sql, rejected). rejected is a reason string when the SQL is known
+    to be incomplete — the stream was cancelled on a blocked keyword, or the
+    model stopped at max_tokens — and the query must not run.
+    """
+    # Static rules first, then the per-database schema (byte-stable while the
+    # schema cache holds). One checkpoint after the schema caches the whole
+    # prefix — the rules alone are far below the model's minimum cacheable size —
+    # so only the question is billed/prefilled as fresh input on repeat calls.
+    content = [
+        {"type": "text", "text": SQL_RULES},
+        {
+            "type": "text",
+            "text": f"Database: {database}\nSchema:\n{schema_context}",
+            "cache_control": {"type": "ephemeral"},
+        },
+        {"type": "text", "text": f"Question: {question}"},
+    ]
 
-    response = bedrock.invoke_model(
+    start = time.monotonic()
+    response = bedrock.invoke_model_with_response_stream(
         modelId=MODEL_ID,
+        performanceConfigLatency="optimized",
         body=json.dumps(
             {
                 "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 512,
-                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": 256,
+                "messages": [{"role": "user", "content": content}],
             }
         ),
     )
-    return json.loads(response["body"].read())["content"][0]["text"].strip()
+
+    # Scan for blocked keywords as tokens arrive; stop generation on the first hit.
+    # Only the tail that could contain a new match is re-scanned per chunk.
+    sql_buffer = ""
+    rejected = None
+    first_token_ms = None
+    for event in response["body"]:
+        if "chunk" not in event:
+            continue
+        payload = json.loads(event["chunk"]["bytes"])
+        if payload.get("type") == "message_delta":
+            if payload["delta"].get("stop_reason") == "max_tokens":
+                rejected = "SQL generation hit max_tokens — query truncated"
+                logger.warning(rejected)
+            continue
+        if payload.get("type") != "content_block_delta":
+            continue
+        delta = payload["delta"].get("text", "")
+        if first_token_ms is None:
+            first_token_ms = (time.monotonic() - start) * 1000
+        sql_buffer += delta
+        # A match touching the end of the buffer may still grow (UPDATE → UPDATED_AT),
+        # so only act on it once the next character has arrived. Searching from pos
+        # (rather than slicing) keeps \b aware of the character before the tail, so
+        # identifiers like is_backdrop don't match mid-word.
+        pos = max(0, len(sql_buffer) - len(delta) - _MAX_KEYWORD_LEN - 1)
+        m = _BLOCKED_RE.search(sql_buffer, pos)
+        if m and m.end() < len(sql_buffer):
+            response["body"].close()
+            rejected = f"Blocked keyword detected: {m.group(0).upper()}"
+            logger.warning("Blocked keyword in generated SQL — stream cancelled")
+            break
+
+    if first_token_ms is not None:
+        emit_first_token_metric(first_token_ms)
+    return sql_buffer.strip(), rejected
+
+
+def emit_first_token_metric(first_token_ms: float):
+    """Record Bedrock time-to-first-token for SQL generation.
+
+    Written as an Embedded Metric Format log line — CloudWatch extracts it from
+    the function's logs, so no API call sits on the request path.
+    """
+    print(
+        json.dumps(
+            {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": "AgenticDE/NLToSQL",
+                            "Dimensions": [["ModelId"]],
+                            "Metrics": [
+                                {"Name": "SQLFirstTokenLatency", "Unit": "Milliseconds"}
+                            ],
+                        }
+                    ],
+                },
+                "ModelId": MODEL_ID,
+                "SQLFirstTokenLatency": first_token_ms,
+            }
+        )
+    )
+
+
+def find_blocked_keyword(sql: str):
+    """Return the first blocked keyword found in the SQL, or None."""
+    m = _BLOCKED_RE.search(sql)
+    return m.group(0).upper() if m else None
 
 
 def validate_sql(sql: str) -> dict:
     """Block any destructive SQL statements."""
+    kw = find_blocked_keyword(sql)
+    if kw:
+        return {"safe": False, "reason": f"Blocked keyword detected: {kw}"}
     upper = sql.upper()
-    for kw in BLOCKED_KEYWORDS:
-        if kw in upper:
-            return {"safe": False, "reason": f"Blocked keyword detected: {kw}"}
     if not upper.strip().startswith("SELECT") and not upper.strip().startswith("WITH"):
         return {"safe": False, "reason": "Only SELECT / WITH queries are permitted"}
     return {"safe": True}
@@ -152,38 +420,93 @@ def run_athena_query(sql: str, database: str) -> str:
 
 
 def poll_query(query_id: str, timeout_seconds: int = 60):
-    """Poll Athena until query finishes or times out."""
-    for _ in range(timeout_seconds // 2):
+    """Poll Athena with exponential backoff until query finishes or times out."""
+    deadline = time.monotonic() + timeout_seconds
+    delay = POLL_INITIAL_DELAY
+    while True:
         response = athena.get_query_execution(QueryExecutionId=query_id)
-        execution = response["QueryExecution"]
-        state = execution["Status"]["State"]
-        if state in ("SUCCEEDED", "FAILED", "CANCELLED"):
-            stats = execution.get("Statistics", {})
-            return state, stats
-        time.sleep(2)
-    return "TIMEOUT", {}
+        if response.get("ResponseMetadata") is None or "QueryExecution" not in response:
+            logger.warning(f"Malformed GetQueryExecution response for {query_id}")
+        else:
+            execution = response["QueryExecution"]
+            state = execution["Status"]["State"]
+            if state in ("SUCCEEDED", "FAILED", "CANCELLED"):
+                stats = execution.get("Statistics", {})
+                return state, stats
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return "TIMEOUT", {}
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX_DELAY)
 
 
 def fetch_results(query_id: str, sql: str, stats: dict) -> dict:
-    """Retrieve and format Athena query results."""
-    results = athena.get_query_results(QueryExecutionId=query_id, MaxResults=100)
-    rows = results["ResultSet"]["Rows"]
-
-    if not rows:
-        return {"sql_generated": sql, "columns": [], "rows": [], "row_count": 0}
+    """Retrieve and format Athena query results, page by page."""
+    paginator = athena.get_paginator("get_query_results")
+    pages = paginator.paginate(
+        QueryExecutionId=query_id,
+        # +1 for the header row; 1000 is the Athena page-size ceiling
+        PaginationConfig={"MaxItems": RESULT_MAX_ROWS + 1, "PageSize": 1000},
+    )
 
-    headers = [c.get("VarCharValue", "") for c in rows[0]["Data"]]
-    data = [
-        [c.get("VarCharValue", "") for c in row["Data"]] for row in rows[1:]
-    ]
+    headers = None
+    data = []
+    for page in pages:
+        rows = iter(page["ResultSet"]["Rows"])
+        if headers is None:
+            header_row = next(rows, None)
+            if header_row is None:
+                break
+            headers = [c.get("VarCharValue", "") for c in header_row["Data"]]
+        data.extend([c.get("VarCharValue", "") for c in row["Data"]] for row in rows)
+
+    if headers is None:
+        return {
+            "sql_generated": sql,
+            "columns": [],
+            "rows": [],
+            "row_count": 0,
+            "truncated": False,
+        }
 
     data_scanned_mb = stats.get("DataScannedInBytes", 0) / (1024 * 1024)
 
-    return {
-        "sql_generated": sql,
-        "columns": headers,
-        "rows": data,
-        "row_count": len(data),
-        "data_scanned_mb": round(data_scanned_mb, 3),
-        "execution_time_ms": stats.get("TotalExecutionTimeInMillis", 0),
-    }
+    return fit_response_budget(
+        {
+            "sql_generated": sql,
+            "columns": headers,
+            "rows": data,
+            "row_count": len(data),
+            "truncated": False,
+            "data_scanned_mb": round(data_scanned_mb, 3),
+            "execution_time_ms": stats.get("TotalExecutionTimeInMillis", 0),
+        }
+    )
+
+
+def _wire_size(value) -> int:
+    """Bytes value takes once dumped to the body string and escaped in the response."""
+    return len(json.dumps(json.dumps(value))) - 2
+
+
+def fit_response_budget(result: dict) -> dict:
+    """Keep the leading rows that fit in RESPONSE_BODY_MAX_BYTES."""
+    rows = result["rows"]
+    base = {**result, "rows": [], "row_count": len(rows), "truncated": True}
+    budget = RESPONSE_BODY_MAX_BYTES - _wire_size(base)
+    kept = 0
+    for row in rows:
+        budget -= _wire_size(row) + 2  # ", " separator
+        if budget < 0:
+            break
+        kept += 1
+
+    if kept < len(rows):
+        logger.warning(f"Result truncated to {kept} of {len(rows)} rows for the agent")
+        result.update(rows=rows[:kept], row_count=kept, truncated=True)
+    return result
+
+
+# Runs once per container, off the cold-start critical path
+warm_connections_on_init()
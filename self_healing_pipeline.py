@@ -5,167 +5,520 @@ Author: Lohith Kumar V
 Triggered automatically when a Glue job enters FAILED state.
 The Bedrock agent diagnoses the error, determines if it can
 self-remediate, and either fixes + re-runs or escalates to humans.
+
+Deployed as two functions from this module:
+  enqueue_handler — EventBridge target; queues the event to SQS and returns
+  lambda_handler  — SQS-triggered worker; runs the agent session per event
 """
 
 import boto3
+import hashlib
 import json
 import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from datetime import datetime, timedelta, timezone
+
+from botocore.config import Config
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-bedrock_runtime = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
-cloudwatch = boto3.client("cloudwatch")
-logs_client = boto3.client("logs")
-sns = boto3.client("sns")
+# Clients are built on first use — e.g. SNS is never needed when the agent
+# auto-remediates — and then reused across warm invocations. Adaptive retries
+# smooth throttling bursts; the lock serialises construction because the
+# default boto3 session isn't thread-safe and the executor builds clients too.
+_cfg = Config(max_pool_connections=10, retries={"mode": "adaptive"})
+# Agent sessions: keep pooled TLS connections alive between warm invocations
+# and size the pool for bursty concurrent sessions
+_bedrock_cfg = Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={"mode": "adaptive", "max_attempts": 3},
+    read_timeout=60,
+    connect_timeout=3,
+)
+_client_lock = threading.Lock()
+
+
+def _client(service: str, config: Config = _cfg, **kwargs):
+    with _client_lock:
+        return boto3.client(service, config=config, **kwargs)
+
+
+@cache
+def _bedrock_runtime():
+    return _client("bedrock-agent-runtime", config=_bedrock_cfg, region_name="us-east-1")
+
+
+@cache
+def _logs():
+    return _client("logs")
+
+
+@cache
+def _glue():
+    return _client("glue")
+
+
+@cache
+def _sns():
+    return _client("sns")
+
+
+@cache
+def _sqs():
+    return _client("sqs")
+
+
+@cache
+def _dynamodb():
+    return _client("dynamodb")
+
 
 AGENT_ID = "YOUR_AGENT_ID"
 AGENT_ALIAS_ID = "PROD"
 ESCALATION_TOPIC_ARN = "arn:aws:sns:us-east-1:YOUR_ACCOUNT_ID:data-engineering-alerts"
+HEAL_QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/YOUR_ACCOUNT_ID/self-healing-events"
 
+# Reused across warm invocations for independent AWS calls
+_executor = ThreadPoolExecutor(max_workers=2)
 
-def lambda_handler(event, context):
+# Error-log search window around the failure event (server-side time bounds).
+# The tail covers CloudWatch Logs ingestion lag after the state change.
+LOG_LOOKBACK = timedelta(hours=1)
+LOG_INGESTION_SLACK = timedelta(minutes=5)
+
+LOG_MAX_LINES = 20
+
+# Logs Insights polling: first check after 50 ms, doubling up to 2 s
+LOG_QUERY_TIMEOUT = 15
+POLL_INITIAL_DELAY = 0.05
+POLL_MAX_DELAY = 2.0
+
+# Burst failures of the same job within one window share a Glue history lookup,
+# as long as the cached history already contains the run being diagnosed.
+# job_name -> (window bucket, runs); bounded by the number of Glue jobs.
+RUN_HISTORY_WINDOW_SECONDS = 60
+_RUN_HISTORY_CACHE: dict[str, tuple[int, tuple]] = {}
+
+RunSummary = namedtuple("RunSummary", ["run_id", "state", "started", "error"])
+
+# Escalation keywords, matched in one pass directly on the raw response bytes.
+# The tail carried between stream chunks catches a keyword split across them.
+_ESCALATE_RE = re.compile(rb"ESCALATE|HUMAN", re.IGNORECASE)
+ESCALATION_SCAN_TAIL = 16
+
+_PROMPT_TMPL = """
+PIPELINE FAILURE ALERT
+
+Failure context (JSON):
+{context_json}
+
+Your task:
+1. Diagnose the root cause (schema drift, data issue, transient AWS error, config problem)
+2. Determine if this is auto-remediable with confidence > 80%
+3. If yes: take corrective action and re-trigger the job
+4. If no: respond with ESCALATE and summarize what a human needs to investigate
+5. If recurred_after_auto_fix is true, an earlier fix for this same failure did
+   not hold: do not repeat it or re-trigger the job with it — try a different
+   remediation only if confident, otherwise ESCALATE
+6. Always explain your reasoning step by step
+"""
+
+# Diagnosis cache: repeat failures with the same signature inside the TTL reuse
+# the earlier agent response instead of a fresh Bedrock session. "exp" is also
+# the table's TTL attribute.
+DIAGNOSIS_CACHE_TABLE = "self-healing-diagnosis-cache"
+DIAGNOSIS_CACHE_TTL = 300
+# Run IDs, UUIDs and timestamps differ between otherwise identical failures:
+# ISO-8601, the yy/MM/dd HH:mm:ss prefix on Glue/Spark log lines, and epoch
+# seconds/milliseconds (e.g. "Timestamp":1728883263123). Other numbers — row
+# counts, limits — are part of the failure and stay in the signature.
+_VOLATILE_RE = re.compile(
+    r"jr_[0-9a-f]+"
+    r"|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+    r"|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+    r"|\d{2}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}(?:[.,]\d+)?"
+    r"|(?<![\w.])1\d{9}(?:\d{3})?(?![\w.])",
+    re.IGNORECASE,
+)
+
+# Only the tail of the error log goes to the agent — the final lines carry the
+# exception; everything before it is mostly prefill cost
+PROMPT_LOG_MAX_CHARS = 4096
+
+
+def enqueue_handler(event, context):
     """
     EventBridge rule: source=aws.glue, detail-type=Glue Job State Change,
     detail.state=FAILED
+
+    Only queues the event — the agent session (seconds to minutes) runs in the
+    SQS worker, so EventBridge isn't held and bursts are absorbed by the queue.
+    Malformed events are rejected here rather than costing a worker invocation.
     """
-    detail = event.get("detail", {})
-    job_name = detail.get("jobName", "unknown")
-    run_id = detail.get("jobRunId", "unknown")
+    try:
+        _, job_name, _ = failure_event_ids(event)
+    except KeyError as e:
+        logger.error(f"Malformed Glue state-change event, missing {e}: {event}")
+        return {"queued": False, "error": f"Malformed event: missing {e}"}
+    _sqs().send_message(QueueUrl=HEAL_QUEUE_URL, MessageBody=json.dumps(event))
+    emit_emf(job_name, {"FailureEventQueued": 1})
+    return {"queued": True, "job_name": job_name}
+
+
+def lambda_handler(event, context):
+    """SQS worker: run the healing flow for each queued Glue failure event."""
+    failures = []
+    for record in event["Records"]:
+        try:
+            result = handle_failure_event(json.loads(record["body"]))
+            logger.info(f"Healing result: {json.dumps(result)}")
+        except Exception:
+            logger.exception(f"Healing failed for message {record['messageId']}")
+            # Partial batch response: only this message returns to the queue
+            failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
+
+
+def handle_failure_event(event) -> dict:
+    """Diagnose and remediate (or escalate) one Glue Job State Change event."""
+    try:
+        detail, job_name, run_id = failure_event_ids(event)
+    except KeyError as e:
+        logger.error(f"Malformed Glue state-change event, missing {e}: {event}")
+        return {"error": f"Malformed event: missing {e}"}
     error_msg = detail.get("message", "No error message provided")
 
     logger.info(f"Pipeline failure detected: {job_name} / {run_id}")
 
-    # Gather rich context for the agent
-    log_context = get_cloudwatch_logs(job_name, run_id)
-    recent_runs = get_recent_run_history(job_name)
-
-    prompt = build_prompt(job_name, run_id, error_msg, log_context, recent_runs)
+    # Gather rich context for the agent — both lookups run concurrently
+    failed_at = parse_event_time(event.get("time"))
+    logs_future = _executor.submit(get_cloudwatch_logs, job_name, run_id, failed_at)
+    runs_future = _executor.submit(get_recent_run_history, job_name, run_id)
+    log_context = logs_future.result()
+    recent_runs = runs_future.result()
+
+    signature = failure_signature(job_name, error_msg, log_context)
+    cached = get_cached_diagnosis(signature)
+    # A repeat of an auto-fixed signature means the fix didn't hold — re-run the
+    # agent (told as much) rather than reporting the old fix as a success.
+    # Only cached escalations are reused; that failure has already been paged.
+    recurred = cached is not None and cached["resolved"]
+    if recurred:
+        logger.warning(f"{job_name}/{run_id} recurred after an auto-fix — re-diagnosing")
+        emit_emf(job_name, {"AutoFixRecurrence": 1})
+    elif cached is not None:
+        logger.info(f"Diagnosis cache hit for {job_name}/{run_id}")
+        emit_emf(job_name, {"DiagnosisCacheHit": 1})
+        return {
+            "job_name": job_name,
+            "run_id": run_id,
+            "agent_steps": 0,
+            "resolved": cached["resolved"],
+            "summary": cached["response"][:500],
+            "cached": True,
+        }
+
+    prompt = build_prompt(
+        job_name, run_id, error_msg, log_context, recent_runs, recurred=recurred
+    )
 
-    # Invoke agent with full trace enabled
-    agent_response, traces = invoke_agent(prompt, session_id=f"heal-{run_id}")
+    # Invoke agent with full trace enabled, deciding on escalation as chunks
+    # arrive so the finished response never needs a second scan
+    response_bytes = bytearray()
+    trace_count = 0
+    needs_escalation = False
+    tail = b""
+    for delta, trace in invoke_agent(prompt, session_id=f"heal-{run_id}"):
+        if trace is not None:
+            trace_count += 1
+            continue
+        response_bytes.extend(delta)
+        window = tail + delta
+        if not needs_escalation and _ESCALATE_RE.search(window):
+            needs_escalation = True
+        tail = window[-ESCALATION_SCAN_TAIL:]
+    # Decoded once at the end — one UTF-8 pass over the whole buffer
+    agent_response = response_bytes.decode("utf-8")
 
     logger.info(f"Agent response: {agent_response}")
 
-    # Emit custom metrics
-    emit_metrics(job_name, traces)
+    # Emit custom metrics (EMF log line — no network call)
+    emit_metrics(job_name, trace_count)
 
-    # If agent couldn't resolve, send SNS alert
-    if "ESCALATE" in agent_response.upper() or "HUMAN" in agent_response.upper():
+    # One escalation decision, made during the stream scan, drives both the SNS
+    # page and the result — no re-scan or uppercased copy of the response.
+    # The page is sent once the stream ends: the summary a human needs follows
+    # the ESCALATE keyword in the agent's answer.
+    if needs_escalation:
         escalate_to_human(job_name, run_id, error_msg, agent_response)
 
+    # Written before returning — a write left on the executor could be frozen
+    # with the container and miss the next identical failure
+    put_cached_diagnosis(signature, agent_response, not needs_escalation)
+
     return {
         "job_name": job_name,
         "run_id": run_id,
-        "agent_steps": len(traces),
-        "resolved": "ESCALATE" not in agent_response.upper(),
+        "agent_steps": trace_count,
+        "resolved": not needs_escalation,
         "summary": agent_response[:500],
     }
 
 
-def build_prompt(job_name, run_id, error_msg, log_context, recent_runs) -> str:
-    return f"""
-PIPELINE FAILURE ALERT
+def failure_event_ids(event):
+    """Return (detail, job_name, run_id); raises KeyError on a malformed event."""
+    # jobName/jobRunId are guaranteed by the Glue Job State Change schema
+    detail = event["detail"]
+    return detail, detail["jobName"], detail["jobRunId"]
 
-Job: {job_name}
-Run ID: {run_id}
-Error: {error_msg}
 
-Recent error logs:
-{log_context}
+def failure_signature(job_name: str, error_msg: str, log_context: str) -> str:
+    """Stable hash of a failure with run-specific identifiers stripped out.
 
-Last 3 run states:
-{json.dumps(recent_runs, indent=2)}
+    job_name is hashed verbatim — digits in a job name distinguish jobs.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(job_name.encode("utf-8"))
+    for part in (error_msg, log_context):
+        h.update(b"\x00")
+        h.update(_VOLATILE_RE.sub("", part).encode("utf-8"))
+    return h.hexdigest()
 
-Your task:
-1. Diagnose the root cause (schema drift, data issue, transient AWS error, config problem)
-2. Determine if this is auto-remediable with confidence > 80%
-3. If yes: take corrective action and re-trigger the job
-4. If no: respond with ESCALATE and summarize what a human needs to investigate
-5. Always explain your reasoning step by step
-"""
+
+def get_cached_diagnosis(signature: str):
+    """Return {"response", "resolved"} for an unexpired signature, else None."""
+    try:
+        item = _dynamodb().get_item(
+            TableName=DIAGNOSIS_CACHE_TABLE, Key={"k": {"S": signature}}
+        ).get("Item")
+        if item and int(item["exp"]["N"]) > time.time():
+            return {"response": item["response"]["S"], "resolved": item["resolved"]["BOOL"]}
+    except Exception as e:
+        logger.warning(f"Diagnosis cache read failed: {e}")
+    return None
+
+
+def put_cached_diagnosis(signature: str, agent_response: str, resolved: bool):
+    """Write-once store: the first diagnosis in a TTL window wins, except that a
+    resolved entry may be replaced once the same failure recurs."""
+    now = int(time.time())
+    try:
+        _dynamodb().put_item(
+            TableName=DIAGNOSIS_CACHE_TABLE,
+            Item={
+                "k": {"S": signature},
+                "response": {"S": agent_response},
+                "resolved": {"BOOL": resolved},
+                "exp": {"N": str(now + DIAGNOSIS_CACHE_TTL)},
+            },
+            # Expired items may linger until TTL reaping, so allow replacing those
+            ConditionExpression=(
+                "attribute_not_exists(k) OR #exp < :now OR #resolved = :true"
+            ),
+            ExpressionAttributeNames={"#exp": "exp", "#resolved": "resolved"},
+            ExpressionAttributeValues={":now": {"N": str(now)}, ":true": {"BOOL": True}},
+        )
+    except _dynamodb().exceptions.ConditionalCheckFailedException:
+        pass
+    except Exception as e:
+        logger.warning(f"Diagnosis cache write failed: {e}")
+
+
+def build_prompt(
+    job_name, run_id, error_msg, log_context, recent_runs, recurred=False
+) -> str:
+    context = {
+        "job": job_name,
+        "run_id": run_id,
+        "error": error_msg,
+        "last_3_runs": [r._asdict() for r in recent_runs],
+    }
+    if recurred:
+        context["recurred_after_auto_fix"] = True
+    # Skip the log section entirely when there is nothing useful to read
+    if not log_context.startswith(("Could not", "No log events")):
+        context["recent_error_logs"] = log_context[-PROMPT_LOG_MAX_CHARS:]
+
+    # Compact JSON — pretty-printing only adds input tokens
+    return _PROMPT_TMPL.format(context_json=json.dumps(context, separators=(",", ":")))
 
 
 def invoke_agent(prompt: str, session_id: str):
-    """Stream agent response and collect traces."""
-    response = bedrock_runtime.invoke_agent(
+    """Stream the agent response, yielding (raw_bytes, None) or (None, trace)."""
+    response = _bedrock_runtime().invoke_agent(
         agentId=AGENT_ID,
         agentAliasId=AGENT_ALIAS_ID,
         sessionId=session_id,
         inputText=prompt,
         enableTrace=True,
+        # Without this the agent returns its final answer as one chunk at the end
+        streamingConfigurations={"streamFinalResponse": True},
     )
 
-    full_text = ""
-    traces = []
-
     for chunk in response["completion"]:
         if "chunk" in chunk:
-            full_text += chunk["chunk"]["bytes"].decode("utf-8")
+            yield chunk["chunk"]["bytes"], None
         elif "trace" in chunk:
             trace = chunk["trace"].get("trace", {})
             if "orchestrationTrace" in trace:
-                traces.append(trace["orchestrationTrace"])
+                yield None, trace["orchestrationTrace"]
+
+
+def parse_event_time(event_time) -> datetime:
+    """EventBridge `time` (ISO-8601, UTC) as an aware datetime; now if missing."""
+    try:
+        return datetime.fromisoformat(event_time.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return datetime.now(timezone.utc)
 
-    return full_text, traces
 
+def get_cloudwatch_logs(job_name: str, run_id: str, failed_at: datetime) -> str:
+    """Fetch the last 20 error log lines for this job run.
 
-def get_cloudwatch_logs(job_name: str, run_id: str) -> str:
-    """Fetch the last 20 error log lines for this job run."""
+    Uses Logs Insights; falls back to paginated filter_log_events when Insights
+    is unavailable (e.g. the account's concurrent-query limit during a burst).
+    """
     try:
-        response = logs_client.filter_log_events(
-            logGroupName="/aws-glue/jobs/error",
-            filterPattern=run_id,
-            limit=20,
-        )
-        lines = [e["message"] for e in response.get("events", [])]
+        try:
+            lines = query_error_logs(run_id, failed_at)
+        except Exception as e:
+            logger.warning(f"Logs Insights unavailable ({e}); using filter_log_events")
+            lines = filter_error_logs(run_id, failed_at)
         return "\n".join(lines) if lines else "No log events found"
     except Exception as e:
         return f"Could not retrieve logs: {e}"
 
 
-def get_recent_run_history(job_name: str) -> list:
-    """Get the last 3 job run states for pattern detection."""
+def query_error_logs(run_id: str, failed_at: datetime) -> list:
+    query_id = _logs().start_query(
+        logGroupName="/aws-glue/jobs/error",
+        startTime=int((failed_at - LOG_LOOKBACK).timestamp()),
+        endTime=int((failed_at + LOG_INGESTION_SLACK).timestamp()),
+        # Glue names the run's error streams after the run ID
+        queryString=(
+            f"fields @timestamp, @message"
+            f" | filter @logStream like /^{run_id}/"
+            f" | sort @timestamp desc | limit {LOG_MAX_LINES}"
+        ),
+    )["queryId"]
+
+    deadline = time.monotonic() + LOG_QUERY_TIMEOUT
+    delay = POLL_INITIAL_DELAY
+    while True:
+        response = _logs().get_query_results(queryId=query_id)
+        if response["status"] == "Complete":
+            break
+        if response["status"] in ("Failed", "Cancelled", "Timeout", "Unknown"):
+            raise RuntimeError(f"Insights query {response['status']}")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            _logs().stop_query(queryId=query_id)
+            raise TimeoutError("Insights query timed out")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX_DELAY)
+
+    # Newest-first from the query; present them in chronological order
+    return [
+        field["value"]
+        for row in reversed(response["results"])
+        for field in row
+        if field["field"] == "@message"
+    ]
+
+
+def filter_error_logs(run_id: str, failed_at: datetime) -> list:
+    # The paginator follows nextToken across sparse pages and stops at MaxItems
+    paginator = _logs().get_paginator("filter_log_events")
+    pages = paginator.paginate(
+        logGroupName="/aws-glue/jobs/error",
+        logStreamNamePrefix=run_id,
+        startTime=int((failed_at - LOG_LOOKBACK).timestamp() * 1000),
+        endTime=int((failed_at + LOG_INGESTION_SLACK).timestamp() * 1000),
+        PaginationConfig={"MaxItems": LOG_MAX_LINES, "PageSize": LOG_MAX_LINES},
+    )
+    lines = []
+    for page in pages:
+        lines.extend(e["message"] for e in page["events"])
+        if len(lines) >= LOG_MAX_LINES:
+            break
+    return lines[:LOG_MAX_LINES]
+
+
+def get_recent_run_history(job_name: str, run_id: str) -> tuple:
+    """Get the last 3 job run states for pattern detection.
+
+    A history cached earlier in the window is reused only if it already lists
+    run_id — otherwise it predates the failing run (or a retry in the burst).
+    Errors are not cached.
+    """
     try:
-        glue = boto3.client("glue")
-        runs = glue.get_job_runs(JobName=job_name, MaxResults=3)["JobRuns"]
-        return [
-            {
-                "run_id": r["Id"],
-                "state": r["JobRunState"],
-                "started": r["StartedOn"].isoformat(),
-                "error": r.get("ErrorMessage", ""),
-            }
-            for r in runs
-        ]
+        bucket = int(time.time() // RUN_HISTORY_WINDOW_SECONDS)
+        cached = _RUN_HISTORY_CACHE.get(job_name)
+        if cached and cached[0] == bucket and any(r.run_id == run_id for r in cached[1]):
+            return cached[1]
+        runs = _fetch_run_history(job_name)
+        _RUN_HISTORY_CACHE[job_name] = (bucket, runs)
+        return runs
     except Exception:
-        return []
+        return ()
 
 
-def emit_metrics(job_name: str, traces: list):
-    """Push custom CloudWatch metrics for the agentic healing operation."""
-    cloudwatch.put_metric_data(
-        Namespace="AgenticDE/SelfHealing",
-        MetricData=[
-            {
-                "MetricName": "AutoRemediationAttempt",
-                "Dimensions": [{"Name": "JobName", "Value": job_name}],
-                "Value": 1,
-                "Unit": "Count",
-            },
+def _fetch_run_history(job_name: str) -> tuple:
+    runs = _glue().get_job_runs(JobName=job_name, MaxResults=3)["JobRuns"]
+    return tuple(
+        RunSummary(
+            run_id=r["Id"],
+            state=r["JobRunState"],
+            started=r["StartedOn"].isoformat(),
+            error=r.get("ErrorMessage", ""),
+        )
+        for r in runs
+    )
+
+
+def emit_metrics(job_name: str, trace_count: int):
+    """Emit custom metrics for the agentic healing operation."""
+    emit_emf(job_name, {"AutoRemediationAttempt": 1, "AgentTraceSteps": trace_count})
+
+
+def emit_emf(job_name: str, metrics: dict):
+    """Write Count metrics as an Embedded Metric Format log line.
+
+    CloudWatch extracts EMF records from the function's logs asynchronously,
+    so this makes no API call from the Lambda.
+    """
+    print(
+        json.dumps(
             {
-                "MetricName": "AgentTraceSteps",
-                "Dimensions": [{"Name": "JobName", "Value": job_name}],
-                "Value": len(traces),
-                "Unit": "Count",
-            },
-        ],
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": "AgenticDE/SelfHealing",
+                            "Dimensions": [["JobName"]],
+                            "Metrics": [
+                                {"Name": name, "Unit": "Count"} for name in metrics
+                            ],
+                        }
+                    ],
+                },
+                "JobName": job_name,
+                **metrics,
+            }
+        )
     )
 
 
 def escalate_to_human(job_name, run_id, error_msg, agent_summary):
     """Send SNS notification when the agent cannot auto-resolve."""
-    sns.publish(
+    _sns().publish(
         TopicArn=ESCALATION_TOPIC_ARN,
         Subject=f"[AgenticDE] Manual intervention needed: {job_name}",
         Message=json.dumps(
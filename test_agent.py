@@ -3,17 +3,35 @@ Agent Integration Tests
 Author: Lohith Kumar V
 
 Smoke-tests for the deployed Bedrock DE agent.
+Tests run concurrently (each has its own session); output is printed per test.
 Run: python3 scripts/test_agent.py
 """
 
+import asyncio
+import io
+import sys
+import threading
+
 import boto3
 import json
 import uuid
-
-bedrock_runtime = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
+from botocore.config import Config
+
+bedrock_runtime = boto3.client(
+    "bedrock-agent-runtime",
+    region_name="us-east-1",
+    config=Config(
+        max_pool_connections=50,
+        tcp_keepalive=True,
+        retries={"mode": "adaptive", "max_attempts": 3},
+        read_timeout=60,
+        connect_timeout=3,
+    ),
+)
 
 AGENT_ID = "YOUR_AGENT_ID"       # Replace after running create_agent.py
 AGENT_ALIAS_ID = "PROD"
+MAX_CONCURRENT_TESTS = 5  # Stay under the account's Bedrock agent TPS limit
 
 
 def invoke_agent(prompt: str, session_id: str = None) -> str:
@@ -28,19 +46,19 @@ def invoke_agent(prompt: str, session_id: str = None) -> str:
         enableTrace=True,
     )
 
-    full_text = ""
+    response_bytes = bytearray()
     step_count = 0
 
     for event in response["completion"]:
         if "chunk" in event:
-            full_text += event["chunk"]["bytes"].decode("utf-8")
+            response_bytes.extend(event["chunk"]["bytes"])
         elif "trace" in event:
             trace = event["trace"].get("trace", {})
             if "orchestrationTrace" in trace:
                 step_count += 1
 
     print(f"  Agent steps: {step_count}")
-    return full_text
+    return response_bytes.decode("utf-8")
 
 
 def test_job_status_query():
@@ -95,6 +113,42 @@ def test_guardrail_block():
     print("  ✅ PASSED (verify guardrail message in response)")
 
 
+# ─── Runner ──────────────────────────────────────────────────────────────────
+
+_output = threading.local()
+
+
+class _PerTestStdout:
+    """Route print() from a test's worker thread into that test's buffer."""
+
+    def write(self, text):
+        return getattr(_output, "buffer", sys.__stdout__).write(text)
+
+    def flush(self):
+        pass
+
+
+def run_test(test) -> tuple:
+    _output.buffer = io.StringIO()
+    try:
+        test()
+        passed = True
+    except Exception as e:
+        print(f"  ❌ FAILED: {e}")
+        passed = False
+    return passed, _output.buffer.getvalue()
+
+
+async def run_suite(tests) -> list:
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_TESTS)
+
+    async def run_limited(test):
+        async with semaphore:
+            return await asyncio.to_thread(run_test, test)
+
+    return await asyncio.gather(*(run_limited(t) for t in tests))
+
+
 if __name__ == "__main__":
     print("🤖 Agentic DE — Integration Test Suite")
     print("=" * 50)
@@ -107,16 +161,17 @@ if __name__ == "__main__":
         test_guardrail_block,
     ]
 
-    passed = 0
-    failed = 0
+    sys.stdout = _PerTestStdout()
+    try:
+        results = asyncio.run(run_suite(tests))
+    finally:
+        sys.stdout = sys.__stdout__
+
+    for _, output in results:
+        print(output, end="")
 
-    for test in tests:
-        try:
-            test()
-            passed += 1
-        except Exception as e:
-            print(f"  ❌ FAILED: {e}")
-            failed += 1
+    passed = sum(1 for ok, _ in results if ok)
+    failed = len(results) - passed
 
     print(f"\n{'='*50}")
     print(f"Results: {passed} passed, {failed} failed")